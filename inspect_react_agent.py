@@ -1,35 +1,99 @@
 # Unified Database Agent - Works with both Anthropic models and Inspect evaluation
 
-from typing import Any, Dict, List, Optional
-from uuid import uuid4
-import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+import asyncio
+import functools
+import logging
 import os
-from langchain_core.messages import AIMessage, convert_to_messages
+import secrets
+import orjson
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage, convert_to_messages
 from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
-from langchain.tools import Tool
+from langchain.tools import StructuredTool
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 from models import FinalReport, DAOGetAllTables, DAOGetSchemaForTable, DAORunSQL
+from semantic_cache import SemanticCache, TTLCache, is_read_only_sql
+from metric_aggregator import MetricAggregator
+from query_decomposer import QueryDecomposer
 from sqlalchemy_utils.sales_dao import SalesDAO
 from db_constants import SALES_DB_CONNECTION_STRING
 from datetime import datetime
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Shared across every agent built in this process; SalesDAO borrows connections from a pooled engine
+dao = SalesDAO(SALES_DB_CONNECTION_STRING)
+
+# Headline aggregates kept warm for the prompt and the get_precomputed_metrics tool
+METRICS = MetricAggregator(dao, ttl=60)
+
+# Results of the schema tools keyed by tool name and arguments. The schema only changes with
+# migrations, so these are shared across samples for an hour.
+SCHEMA_TOOL_CACHE = TTLCache(max_entries=256, ttl=3600)
+
+# Answers to previous production queries; paraphrased repeats are served without running the agent.
+# They expire on the same schedule as cached SQL results so answers never drift far from the database
+QUERY_CACHE = SemanticCache(threshold=0.95, ttl=60)
+
 REACT_AGENT_PROMPT = """You are a database agent. Your job is to answer the user's question using the tools provided
-to query the database. Make sure to always check for the schema of the tables before querying the database directly"""
+to query the database. Make sure you know the schema of a table before querying it.
+You can call several tools in the same turn, e.g. request the schema of every table you need at once."""
+
+# Log writes still in flight; holding a reference keeps the tasks from being garbage collected
+_PENDING_LOG_TASKS: set = set()
+
+# Pretty-print message logs only when debugging; compact JSON is about half the bytes
+DEBUG_LOGS = os.getenv("AGENT_DEBUG_LOGS", "").lower() in ("1", "true")
 
 def log_messages_to_json(messages: list, filename: str):
-    log_messages = [dict(m) for m in messages]
-    with open(filename, 'w') as f:
-        json.dump(log_messages, f, indent=2, ensure_ascii=False)
+    log_messages = [m.model_dump(mode="json") for m in messages]
+    with open(filename, 'wb') as f:
+        f.write(orjson.dumps(log_messages, option=orjson.OPT_INDENT_2 if DEBUG_LOGS else None))
+
+def log_messages_in_background(messages: list, filename: str):
+    """Write the message log on a worker thread so the agent turn never waits on disk I/O"""
+    task = asyncio.create_task(asyncio.to_thread(log_messages_to_json, messages, filename))
+    _PENDING_LOG_TASKS.add(task)
+    task.add_done_callback(_PENDING_LOG_TASKS.discard)
 
-def create_database_tools(dao: SalesDAO) -> List[Tool]:
+def log_agent_run(thread_id: str, messages: list):
+    log_filename = f"logs/agent_query_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{thread_id}.json"
+    log_messages_in_background(messages, log_filename)
+
+async def flush_logs():
+    """Wait for all background log writes to finish (call before the event loop exits)"""
+    if _PENDING_LOG_TASKS:
+        await asyncio.gather(*_PENDING_LOG_TASKS)
+
+def _run_in_thread(func):
+    """Wrap a blocking tool function in a coroutine so parallel tool calls run concurrently"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return wrapper
+
+def _cached_tool(name: str, func):
+    """Memoize a side-effect free tool function on its arguments"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (name, orjson.dumps([args, kwargs], option=orjson.OPT_SORT_KEYS, default=str))
+        result = SCHEMA_TOOL_CACHE.get(key)
+        if result is None:
+            generation = SCHEMA_TOOL_CACHE.generation
+            result = func(*args, **kwargs)
+            SCHEMA_TOOL_CACHE.put(key, result, generation)
+        return result
+    return wrapper
+
+def create_database_tools(dao: SalesDAO) -> List[StructuredTool]:
     """Create LangChain tools from your Pydantic models"""
     
-    def get_all_tables(_input: str = ""):
+    def get_all_tables():
         """Get all table names from the database"""
         model = DAOGetAllTables()
         return model(dao)
@@ -39,56 +103,122 @@ def create_database_tools(dao: SalesDAO) -> List[Tool]:
         model = DAOGetSchemaForTable(table_name=table_name)
         return model(dao)
     
+    # Schema lookups are pure between migrations; run_sql caches SELECTs itself (see DAORunSQL)
+    get_all_tables = _cached_tool("get_all_tables", get_all_tables)
+    get_schema_for_table = _cached_tool("get_schema_for_table", get_schema_for_table)
+    
     def run_sql(query: str, params: Dict[str, Any] | None = None):
         """Execute a SQL query and return results"""
         model = DAORunSQL(query=query, params=params)
-        return model(dao)
+        result = model(dao)
+        if not is_read_only_sql(query):
+            # Writes may include DDL, so the cached schema answers may be out of date
+            SCHEMA_TOOL_CACHE.clear()
+        return result
+    
+    def get_precomputed_metrics():
+        """Get the cached headline sales metrics"""
+        return METRICS.snapshot()
     
-    def final_report(summary: str, recommendations: str = ""):
+    def final_report(summary: str, task_completed: bool = True):
         """Generate the final report with findings and recommendations"""
-        model = FinalReport(summary=summary, recommendations=recommendations)
+        model = FinalReport(summary=summary, task_completed=task_completed)
         return model()
     
-    # Convert to LangChain Tools
+    # Convert to LangChain Tools. Each tool gets an async coroutine so that when the model
+    # emits several tool calls in one turn, ToolNode executes them concurrently. Tools backed
+    # by a model in models.py reuse it as args_schema instead of re-deriving one from the signature.
     tools = [
-        Tool(
+        StructuredTool.from_function(
+            func=get_all_tables,
+            coroutine=_run_in_thread(get_all_tables),
             name="get_all_tables",
-            description="Get all table names from the database",
-            func=get_all_tables
+            args_schema=DAOGetAllTables,
+            description="Get all table names from the database"
         ),
-        Tool(
-            name="get_schema_for_table", 
-            description="Get schema information for a specific table. Input should be the table name.",
-            func=get_schema_for_table
+        StructuredTool.from_function(
+            func=get_schema_for_table,
+            coroutine=_run_in_thread(get_schema_for_table),
+            name="get_schema_for_table",
+            args_schema=DAOGetSchemaForTable,
+            description="Get schema information for a specific table. Call it once per table; several tables may be requested in the same turn."
         ),
-        Tool(
+        StructuredTool.from_function(
+            func=run_sql,
+            coroutine=_run_in_thread(run_sql),
             name="run_sql",
-            description="Execute a SQL query and return results. Input should be a valid SQL query string.",
-            func=run_sql
+            args_schema=DAORunSQL,
+            description="Execute a SQL query and return results. Input should be a valid SQL query string."
         ),
-        Tool(
+        StructuredTool.from_function(
+            func=get_precomputed_metrics,
+            coroutine=_run_in_thread(get_precomputed_metrics),
+            name="get_precomputed_metrics",
+            description="Get pre-computed sales metrics (total sales, transaction count, customers, returns) without running SQL"
+        ),
+        StructuredTool.from_function(
+            func=final_report,
+            coroutine=_run_in_thread(final_report),
             name="final_report",
-            description="Generate the final report with findings and recommendations. Input should be a summary string.",
-            func=final_report
+            args_schema=FinalReport,
+            description="Generate the final report with findings and recommendations. Input should be a summary string."
         )
     ]
     
     return tools
 
-def db_agent(*, react_agent_prompt: str, use_anthropic: bool = True, model_name: str = None):
-    """Database analysis agent that works with both Anthropic and Inspect evaluation.
+def render_schema(dao: SalesDAO) -> str:
+    """Format every table's columns as a markdown block for the system prompt (empty if the database is unreachable)"""
+    try:
+        blocks = []
+        for table_name in dao.get_all_tables():
+            schema = dao.get_schema_for_table(table_name)
+            rows = [f"| {name} | {column_type} | {'yes' if nullable else 'no'} |"
+                    for name, column_type, nullable in schema['columns']]
+            blocks.append(f"### {table_name}\n| column | type | nullable |\n|---|---|---|\n" + "\n".join(rows))
+    except Exception:
+        logger.warning("Could not render the database schema for the prompt", exc_info=True)
+        return ""
+    if not blocks:
+        return ""
+    return (
+        "Database schema:\n\n"
+        + "\n\n".join(blocks)
+        + "\n\nUse these tables directly; only call get_schema_for_table for tables not listed here."
+    )
+
+def new_thread_id() -> str:
+    """Short random id for a LangGraph thread (cheaper than str(uuid4()))"""
+    return secrets.token_hex(8)
+
+def _to_input_messages(sample: Any) -> list:
+    # Handle different input formats
+    if isinstance(sample, dict) and "input" in sample:
+        # Inspect evaluation format
+        return convert_to_messages(sample["input"])
+    # Direct usage format
+    return convert_to_messages([{"role": "user", "content": str(sample)}])
+
+def build_executor(react_agent_prompt: str, use_anthropic: bool = True, model_name: Optional[str] = None):
+    """Return the executor for this configuration and the current database schema.
+    
+    The schema block is part of the cache key: if the database was unreachable when an
+    executor was built, the next call (once the schema renders) builds one with the schema
+    instead of keeping the schema-less prompt for the life of the process. The reflected
+    schema is memoized by the DAO, so rendering it again is cheap.
     
-    Args:
-        use_anthropic: If True, use Anthropic model. If False, use OpenAI interface (for Inspect)
-        model_name: Specific model name to use
-        
     Returns:
-        Agent function for handling samples. May be passed to Inspect `bridge()`
-        to create a standard Inspect solver.
+        (executor, checkpointer, decomposer) tuple
     """
+    return _build_executor(react_agent_prompt, use_anthropic, model_name, render_schema(dao))
+
+@functools.lru_cache(maxsize=4)
+def _build_executor(react_agent_prompt: str, use_anthropic: bool, model_name: Optional[str], schema_block: str):
+    """Build the model, tools and LangGraph executor once per configuration.
     
-    # Initialize DAO
-    dao = SalesDAO(SALES_DB_CONNECTION_STRING)
+    Every db_agent() with the same settings reuses them, so tool schemas and the
+    compiled graph are not rebuilt per sample.
+    """
     
     # Create tools
     tools = create_database_tools(dao)
@@ -100,51 +230,175 @@ def db_agent(*, react_agent_prompt: str, use_anthropic: bool = True, model_name:
             model_name = "claude-3-haiku-20240307"
         model = ChatAnthropic(
             model=model_name,
-            api_key=os.environ["ANTHROPIC_API_KEY"]
+            api_key=os.environ["ANTHROPIC_API_KEY"],
+            streaming=True,
+            # Batched runs make many concurrent requests, ride out rate limits instead of failing
+            max_retries=6,
+            default_request_timeout=120
         )
     else:
-        # Evaluation mode with Inspect (uses OpenAI interface redirected to Inspect)
+        # Evaluation mode with Inspect (uses OpenAI interface redirected to Inspect).
+        # No streaming here: the Inspect bridge answers with a complete ChatCompletion.
         model = ChatOpenAI(model="inspect")
     
+    decomposer = QueryDecomposer(model)
+    
+    # Allow the model to request several tools per turn (e.g. every table schema at once)
+    agent_model = model.bind_tools(tools, parallel_tool_calls=True)
+    
+    # Compute the metrics now so the first model call doesn't wait on the database
+    METRICS.warm()
+    
+    # The schema is fixed between migrations, so putting it in the prompt saves the discovery turns
+    system_prompt = react_agent_prompt
+    if schema_block:
+        system_prompt = f"{system_prompt}\n\n{schema_block}"
+    
+    # The metrics block is rendered on every model call so it follows the background refreshes
+    def prompt_with_metrics(state) -> list:
+        return [SystemMessage(content=f"{system_prompt}\n\n{METRICS.render()}")] + state["messages"]
+    
     # Create the LangGraph agent
+    checkpointer = MemorySaver()
     executor = create_react_agent(
-        model=model,
+        model=agent_model,
         tools=tools,
-        checkpointer=MemorySaver(),
-        prompt=react_agent_prompt
+        checkpointer=checkpointer,
+        prompt=prompt_with_metrics
     )
+    return executor, checkpointer, decomposer
+
+def db_agent(*, react_agent_prompt: str, use_anthropic: bool = True, model_name: str = None,
+             cache: Optional[SemanticCache] = None, decompose: bool = True):
+    """Database analysis agent that works with both Anthropic and Inspect evaluation.
+    
+    Args:
+        use_anthropic: If True, use Anthropic model. If False, use OpenAI interface (for Inspect)
+        model_name: Specific model name to use
+        cache: Optional semantic cache of final answers keyed by the user query
+        decompose: If True, compound questions are split into sub-questions answered concurrently
+        
+    Returns:
+        Agent function for handling samples. May be passed to Inspect `bridge()`
+        to create a standard Inspect solver. Its `stream` attribute is an async
+        generator over the answer's tokens for interactive use, and `run_many`
+        answers a list of samples concurrently.
+    """
+    
+    executor, checkpointer, decomposer = build_executor(react_agent_prompt, use_anthropic, model_name)
+    if not decompose:
+        decomposer = None
+    # Different models give different answers, so they must not share cached ones
+    cache_scope = (use_anthropic, model_name)
+    
+    async def answer(messages: list) -> str:
+        """Run one ReAct loop on its own thread and return the final message content"""
+        thread_id = new_thread_id()
+        final_state = None
+        try:
+            async for state in executor.astream(
+                input={"messages": messages},
+                config={"configurable": {"thread_id": thread_id}},
+                stream_mode="values",
+            ):
+                final_state = state
+        finally:
+            # Each sample is a one-off conversation, so free its checkpoints right away
+            await checkpointer.adelete_thread(thread_id)
+        log_agent_run(thread_id, final_state["messages"])
+        
+        # Content of last message
+        message: AIMessage = final_state["messages"][-1]
+        return str(message.content)
     
     # Sample handler (works for both production and evaluation)
     async def run(sample: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
-        # Handle different input formats
-        if isinstance(sample, dict) and "input" in sample:
-            # Inspect evaluation format
-            input_messages = convert_to_messages(sample["input"])
+        input_messages = _to_input_messages(sample)
+        
+        query_text = "\n".join(str(m.content) for m in input_messages)
+        if cache is not None:
+            # Embedding the query is CPU work, keep it off the event loop
+            cached_output = await asyncio.to_thread(cache.get, query_text, cache_scope)
+            if cached_output is not None:
+                return dict(output=cached_output)
+        
+        question = str(input_messages[-1].content)
+        sub_questions = await decomposer.decompose(question) if decomposer else [question]
+        
+        # Execute the agent, once per independent sub-question
+        if len(sub_questions) == 1:
+            output = await answer(input_messages)
         else:
-            # Direct usage format
-            input_messages = convert_to_messages([{"role": "user", "content": str(sample)}])
+            answers = await asyncio.gather(*[
+                answer(input_messages[:-1] + [HumanMessage(content=sub_question)])
+                for sub_question in sub_questions
+            ])
+            output = await decomposer.synthesize(question, sub_questions, list(answers))
         
-        # Execute the agent
-        result = await executor.ainvoke(
-            input={"messages": input_messages},
-            config={"configurable": {"thread_id": str(uuid4())}},
-        )
-        log_filename = f"logs/agent_query_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        log_messages_to_json(result["messages"], log_filename)
+        if cache is not None:
+            await asyncio.to_thread(cache.put, query_text, output, cache_scope)
+        return dict(output=output)
+    
+    async def stream(sample: dict[str, Any]) -> AsyncIterator[str]:
+        """Yield the text the model generates as it is produced (no cache or decomposition)"""
+        thread_id = new_thread_id()
+        final_state = None
+        try:
+            async for mode, chunk in executor.astream(
+                input={"messages": _to_input_messages(sample)},
+                config={"configurable": {"thread_id": thread_id}},
+                stream_mode=["messages", "values"],
+            ):
+                if mode == "values":
+                    final_state = chunk
+                    continue
+                message, metadata = chunk
+                if isinstance(message, AIMessageChunk) and metadata.get("langgraph_node") == "agent":
+                    token = message.text()
+                    if token:
+                        yield token
+        finally:
+            await checkpointer.adelete_thread(thread_id)
+        if final_state is not None:
+            log_agent_run(thread_id, final_state["messages"])
+    
+    async def run_many(samples: list, concurrency: int = 8) -> list[dict[str, Any]]:
+        """Answer several samples at once, overlapping their LLM and tool I/O (no cache or decomposition)"""
+        thread_ids = [new_thread_id() for _ in samples]
+        try:
+            results = await executor.abatch(
+                [{"messages": _to_input_messages(sample)} for sample in samples],
+                config=[{"configurable": {"thread_id": thread_id}, "max_concurrency": concurrency}
+                        for thread_id in thread_ids],
+            )
+        finally:
+            await asyncio.gather(*[checkpointer.adelete_thread(thread_id) for thread_id in thread_ids])
         
-        # Return output (content of last message)
-        message: AIMessage = result["messages"][-1]
-        return dict(output=str(message.content))
+        outputs = []
+        for thread_id, result in zip(thread_ids, results):
+            log_agent_run(thread_id, result["messages"])
+            message: AIMessage = result["messages"][-1]
+            outputs.append(dict(output=str(message.content)))
+        return outputs
     
+    run.stream = stream
+    run.run_many = run_many
     return run
 
 # For direct production usage
 async def query_database_agent(query: str, use_anthropic: bool = True, model_name: str = None):
     """Direct interface for production usage"""
-    agent = db_agent(react_agent_prompt=REACT_AGENT_PROMPT, use_anthropic=use_anthropic, model_name=model_name)
+    agent = db_agent(react_agent_prompt=REACT_AGENT_PROMPT, use_anthropic=use_anthropic, model_name=model_name,
+                     cache=QUERY_CACHE)
     final_message = await agent(query)
     return final_message
 
+async def stream_database_agent(query: str, use_anthropic: bool = True, model_name: str = None) -> AsyncIterator[str]:
+    """Production interface that yields the answer's tokens as they arrive"""
+    agent = db_agent(react_agent_prompt=REACT_AGENT_PROMPT, use_anthropic=use_anthropic, model_name=model_name)
+    async for token in agent.stream(query):
+        yield token
+
 # For Inspect evaluation usage
 def db_agent_for_inspect():
     """Agent configured specifically for Inspect evaluation"""
@@ -154,15 +408,13 @@ def db_agent_for_inspect():
 
 if __name__ == "__main__":
     import asyncio
-    dao = SalesDAO(SALES_DB_CONNECTION_STRING)
-    
-    tools = create_database_tools(dao)
     # # Production usage with Anthropic
     async def production_example():
         # query = "What is the total value of all sales in the database as of right now? And how many total transactions have been made?"
         query = 'What is the total revenue in the database?'
         result = await query_database_agent(query, use_anthropic=True)
         print(f"Production result: {result}")
+        await flush_logs()
     
     # # Run production example
     asyncio.run(production_example())
@@ -0,0 +1,99 @@
+# Pre-computed sales metrics so the hottest aggregate questions skip the SQL round trips
+
+from typing import Any, Dict, Optional
+from datetime import datetime
+from decimal import Decimal
+import asyncio
+import logging
+import threading
+import time
+from sqlalchemy_utils.sales_dao import SalesDAO
+
+logger = logging.getLogger(__name__)
+
+
+class MetricAggregator:
+    """
+    Keeps a snapshot of the registered sales metrics (see SalesDAO.get_sales_metrics).
+    The snapshot is refreshed in the background once it is older than `ttl` seconds;
+    readers always get the latest snapshot without waiting (an empty one until the
+    first refresh succeeds). Failed refreshes are retried at most once per `ttl`.
+    """
+
+    def __init__(self, dao: SalesDAO, ttl: float = 60.0):
+        self.dao = dao
+        self.ttl = ttl
+        self._snapshot: Dict[str, Any] = {}
+        self._computed_at: Optional[float] = None
+        self._attempted_at: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_stale(self) -> bool:
+        return self._computed_at is None or time.monotonic() - self._computed_at > self.ttl
+
+    def refresh(self) -> Dict[str, Any]:
+        """Recompute the metrics from the database (blocking)"""
+        with self._lock:
+            self._attempted_at = time.monotonic()
+            metrics = {
+                name: float(value) if isinstance(value, Decimal) else value
+                for name, value in self.dao.get_sales_metrics().items()
+            }
+            metrics["as_of"] = datetime.now().isoformat(timespec="seconds")
+            self._snapshot = metrics
+            self._computed_at = time.monotonic()
+            return metrics
+
+    async def arefresh(self) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.refresh)
+
+    @staticmethod
+    def _log_refresh_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Background refresh of pre-computed metrics failed", exc_info=task.exception())
+
+    def _schedule_refresh(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Called from a worker thread or plain sync code, refreshing inline is fine there
+            self.refresh()
+            return
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = loop.create_task(self.arefresh())
+            self._refresh_task.add_done_callback(self._log_refresh_failure)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return the current metrics, kicking off a refresh if they are stale. On the event loop
+        the refresh runs in the background and this never blocks on the database.
+        """
+        if self.is_stale and (self._attempted_at is None or time.monotonic() - self._attempted_at > self.ttl):
+            self._schedule_refresh()
+        return self._snapshot
+
+    def warm(self):
+        """Start computing the first snapshot up front; on failure it is retried on later use"""
+        try:
+            self.snapshot()
+        except Exception:
+            logger.warning("Could not compute pre-computed metrics", exc_info=True)
+
+    def render(self) -> str:
+        """Format the snapshot as a prompt block (empty while no metrics are available)"""
+        try:
+            metrics = dict(self.snapshot())
+        except Exception:
+            logger.warning("Could not compute pre-computed metrics", exc_info=True)
+            return ""
+        if not metrics:
+            return ""
+        as_of = metrics.pop("as_of", "unknown")
+        lines = [f"- {name}: {value}" for name, value in metrics.items()]
+        return (
+            f"Pre-computed metrics for the whole database (as of {as_of}):\n"
+            + "\n".join(lines)
+            + "\nIf these answer the question, use them directly instead of querying the database."
+        )
@@ -1,5 +1,10 @@
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
+from functools import lru_cache
+from semantic_cache import SQLResultCache, is_read_only_sql, parameterize_sql
+
+# Results of read-only queries, shared by every DAORunSQL call in the process
+SQL_RESULT_CACHE = SQLResultCache()
 
 
 class FinalReport(BaseModel):
@@ -39,7 +44,38 @@ class DAORunSQL(BaseModel):
     params: Optional[Dict[str, Any]] = None
 
     def __call__(self, dao):
-        return dao.run_sql(self.query, self.params)
+        # Lift the literals the LLM inlined into bind params, so queries that only differ in
+        # their constants share one statement text
+        query, literal_params = parameterize_sql(self.query)
+        params = {**literal_params, **(self.params or {})} or None
+
+        if not is_read_only_sql(query):
+            result = dao.run_sql(query, params)
+            # A write can change any cached result
+            SQL_RESULT_CACHE.clear()
+            return result
+
+        key = SQL_RESULT_CACHE.make_key(query, params)
+        result = SQL_RESULT_CACHE.get(key)
+        if result is None:
+            # A write running in parallel may clear the cache before this read finishes
+            generation = SQL_RESULT_CACHE.generation
+            result = dao.run_sql(query, params)
+            SQL_RESULT_CACHE.put(key, result, generation)
+        if getattr(result, "truncated", False):
+            # Tell the model it is only seeing the first rows so it adds a LIMIT or aggregates instead
+            return {"rows": list(result), "truncated": True}
+        return result
+
+
+# Namespace every PythonCodeExecutor run starts from
+_BASE_GLOBALS = {"__builtins__": __builtins__}
+
+
+@lru_cache(maxsize=128)
+def _compile_code(code: str):
+    """Compile each distinct snippet once; repeated calls skip parsing"""
+    return compile(code, "<tool>", "exec")
 
 
 class PythonCodeExecutor(BaseModel):
@@ -56,23 +92,14 @@ class PythonCodeExecutor(BaseModel):
         The code can access any variables passed in kwargs.
         """
         # Create execution environment
-        exec_globals = globals().copy()
-        if self.globals_dict:
-            exec_globals.update(self.globals_dict)
-        
-        exec_locals = locals().copy()
-        if self.locals_dict:
-            exec_locals.update(self.locals_dict)
-        
-        # Add kwargs to locals for code access
-        exec_locals.update(kwargs)
+        exec_globals = {**_BASE_GLOBALS, **(self.globals_dict or {})}
+        exec_locals = {**(self.locals_dict or {}), **kwargs}
         
         try:
             # Execute the code
-            exec(self.code, exec_globals, exec_locals)
+            exec(_compile_code(self.code), exec_globals, exec_locals)
             
             # Return any result (assuming the code stores it in a variable called 'result')
             return exec_locals.get('result', None)
         except Exception as e:
             return {"error": str(e), "error_type": type(e).__name__}
-
@@ -1,18 +1,40 @@
 import psycopg2
+import logging
 import os
+from contextlib import contextmanager
+from functools import lru_cache
 from psycopg2 import Error
+from psycopg2.pool import ThreadedConnectionPool
 from db_constants import SALES_DB_CONNECTION_STRING
 
-def get_pgsql_connection(connection_string: str):
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=None)
+def _get_pool(connection_string: str) -> ThreadedConnectionPool:
+    """One process-wide pool per DSN, created on first use so importing this module never connects"""
+    return ThreadedConnectionPool(minconn=1, maxconn=20, dsn=connection_string)
+
+@contextmanager
+def get_pgsql_connection(connection_string: str = SALES_DB_CONNECTION_STRING):
     """
-    Connect to sales database using environment variables
+    Borrow a connection to the sales database from the shared pool:
+
+        with get_pgsql_connection() as conn:
+            ...
+
+    The connection goes back to the pool on exit; any transaction left open is rolled back.
     """
     try:
-        connection = psycopg2.connect(connection_string)
-        
-        print("Successfully connected to sales database!")
-        return connection
-        
-    except (Exception, Error) as error:
-        print(f"Error connecting to PostgreSQL: {error}")
-        return None
\ No newline at end of file
+        pool = _get_pool(connection_string)
+        connection = pool.getconn()
+        logger.debug("Connected to sales database")
+    except (Exception, Error):
+        logger.exception("Error connecting to PostgreSQL")
+        raise
+
+    try:
+        yield connection
+    finally:
+        if not connection.closed:
+            connection.rollback()
+        pool.putconn(connection, close=bool(connection.closed))
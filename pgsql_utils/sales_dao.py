@@ -4,10 +4,12 @@ from datetime import date, datetime
 from decimal import Decimal
 from typing import List, Optional, Dict, Any
 from connection import get_sales_db_session, Base
-from sqlalchemy import Column, Integer, String, Date, Numeric, DateTime, Text
-import logging 
+from sqlalchemy import Column, Integer, String, Date, Numeric, DateTime, Text, Computed, Index
+import logging
+import os
 
-logging.basicConfig(level=logging.INFO)
+# WARNING by default so the per-call debug chatter is skipped entirely; set LOG_LEVEL=DEBUG in dev
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
 logger = logging.getLogger(__name__)
 
 class Transaction(Base):
@@ -22,9 +24,19 @@ class Transaction(Base):
     product_id = Column(Integer)
     quantity = Column(Integer, nullable=False)
     unit_price = Column(Numeric(10, 2), nullable=False)
-    total_amount = Column(Numeric(10, 2), nullable=False)
+    # Generated by Postgres (GENERATED ALWAYS AS ... STORED), never written from Python
+    total_amount = Column(Numeric(10, 2), Computed("quantity * unit_price", persisted=True))
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # get_transactions_by_date_range / get_all_transactions: index scan in date order, no sort
+        Index('transactions_date_idx', transaction_date.desc()),
+        # get_transactions_by_customer: filter and ORDER BY transaction_date DESC from one index
+        Index('transactions_customer_date_idx', customer_id, transaction_date.desc()),
+        # get_top_customers: covering index so the per-customer SUM is an index-only scan
+        Index('transactions_customer_total_idx', customer_id, postgresql_include=['total_amount']),
+    )
+
 class SalesDAO:
     """
     Data Access Object for sales database operations using SQLAlchemy
@@ -47,18 +59,18 @@ class SalesDAO:
         try:
             self.session = get_sales_db_session()
             if self.session:
-                print("Successfully connected to sales database!")
+                logger.debug("Connected to sales database")
                 return True
             return False
         except Exception as error:
-            print(f"Error connecting to database: {error}")
+            logger.exception("Error connecting to database")
             return False
     
     def disconnect(self):
         """Close database connection"""
         if self.session:
             self.session.close()
-            print("Database connection closed.")
+            logger.debug("Database connection closed")
     
     def commit(self):
         """Commit current transaction"""
@@ -79,7 +91,7 @@ class SalesDAO:
         try:
             return self.session.query(Transaction).order_by(desc(Transaction.transaction_date)).all()
         except Exception as error:
-            print(f"Error fetching transactions: {error}")
+            logger.exception("Error fetching transactions")
             return []
     
     def get_transaction_by_id(self, transaction_id: int) -> Optional[Transaction]:
@@ -90,7 +102,7 @@ class SalesDAO:
         try:
             return self.session.query(Transaction).filter(Transaction.id == transaction_id).first()
         except Exception as error:
-            print(f"Error fetching transaction {transaction_id}: {error}")
+            logger.exception("Error fetching transaction %s", transaction_id)
             return None
     
     def get_transactions_by_date_range(self, start_date: date, end_date: date) -> List[Transaction]:
@@ -103,7 +115,7 @@ class SalesDAO:
                 Transaction.transaction_date.between(start_date, end_date)
             ).order_by(desc(Transaction.transaction_date)).all()
         except Exception as error:
-            print(f"Error fetching transactions by date range: {error}")
+            logger.exception("Error fetching transactions by date range")
             return []
     
     def get_transactions_by_customer(self, customer_id: int) -> List[Transaction]:
@@ -116,7 +128,7 @@ class SalesDAO:
                 Transaction.customer_id == customer_id
             ).order_by(desc(Transaction.transaction_date)).all()
         except Exception as error:
-            print(f"Error fetching transactions for customer {customer_id}: {error}")
+            logger.exception("Error fetching transactions for customer %s", customer_id)
             return []
     
     def insert_transaction(self, transaction_data: Dict[str, Any]) -> Optional[Transaction]:
@@ -125,30 +137,46 @@ class SalesDAO:
             return None
         
         try:
-            # Calculate total amount if not provided
-            if 'total_amount' not in transaction_data:
-                quantity = transaction_data.get('quantity', 0)
-                unit_price = transaction_data.get('unit_price', 0)
-                transaction_data['total_amount'] = Decimal(str(quantity)) * Decimal(str(unit_price))
-            
-            # Convert date string to date object if needed
-            if isinstance(transaction_data.get('transaction_date'), str):
-                transaction_data['transaction_date'] = datetime.strptime(
-                    transaction_data['transaction_date'], '%Y-%m-%d'
-                ).date()
-            
-            new_transaction = Transaction(**transaction_data)
+            new_transaction = Transaction(**self._prepare_transaction_data(transaction_data))
             self.session.add(new_transaction)
             self.session.commit()
             
-            print(f"Successfully inserted transaction with ID: {new_transaction.id}")
+            logger.debug("Inserted transaction id=%s", new_transaction.id)
             return new_transaction
             
         except Exception as error:
-            print(f"Error inserting transaction: {error}")
+            logger.exception("Error inserting transaction")
             self.session.rollback()
             return None
     
+    def bulk_insert_transactions(self, rows: List[Dict[str, Any]]) -> int:
+        """Insert many transactions in one batch without building ORM objects per row"""
+        if not self.session:
+            return 0
+        
+        try:
+            self.session.bulk_insert_mappings(
+                Transaction, [self._prepare_transaction_data(row) for row in rows]
+            )
+            self.session.commit()
+            logger.debug("Inserted %s transactions", len(rows))
+            return len(rows)
+            
+        except Exception as error:
+            logger.exception("Error bulk inserting transactions")
+            self.session.rollback()
+            return 0
+    
+    @staticmethod
+    def _prepare_transaction_data(transaction_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Drop the generated total_amount and parse string dates"""
+        data = {key: value for key, value in transaction_data.items() if key != 'total_amount'}
+        
+        # Convert date string to date object if needed
+        if isinstance(data.get('transaction_date'), str):
+            data['transaction_date'] = datetime.strptime(data['transaction_date'], '%Y-%m-%d').date()
+        return data
+    
     def update_transaction(self, transaction_id: int, update_data: Dict[str, Any]) -> bool:
         """Update an existing transaction"""
         if not self.session:
@@ -157,24 +185,20 @@ class SalesDAO:
         try:
             transaction = self.get_transaction_by_id(transaction_id)
             if not transaction:
-                print(f"Transaction {transaction_id} not found")
+                logger.info("Transaction %s not found", transaction_id)
                 return False
             
-            # Update fields
+            # Update fields (total_amount is recalculated by Postgres)
             for key, value in update_data.items():
-                if hasattr(transaction, key):
+                if key != 'total_amount' and hasattr(transaction, key):
                     setattr(transaction, key, value)
             
-            # Recalculate total amount if quantity or unit_price changed
-            if 'quantity' in update_data or 'unit_price' in update_data:
-                transaction.total_amount = Decimal(str(transaction.quantity)) * Decimal(str(transaction.unit_price))
-            
             self.session.commit()
-            print(f"Successfully updated transaction {transaction_id}")
+            logger.debug("Updated transaction id=%s", transaction_id)
             return True
             
         except Exception as error:
-            print(f"Error updating transaction {transaction_id}: {error}")
+            logger.exception("Error updating transaction %s", transaction_id)
             self.session.rollback()
             return False
     
@@ -186,16 +210,16 @@ class SalesDAO:
         try:
             transaction = self.get_transaction_by_id(transaction_id)
             if not transaction:
-                print(f"Transaction {transaction_id} not found")
+                logger.info("Transaction %s not found", transaction_id)
                 return False
             
             self.session.delete(transaction)
             self.session.commit()
-            print(f"Successfully deleted transaction {transaction_id}")
+            logger.debug("Deleted transaction id=%s", transaction_id)
             return True
             
         except Exception as error:
-            print(f"Error deleting transaction {transaction_id}: {error}")
+            logger.exception("Error deleting transaction %s", transaction_id)
             self.session.rollback()
             return False
     
@@ -208,7 +232,7 @@ class SalesDAO:
         try:
             return self.session.query(func.count(Transaction.id)).scalar()
         except Exception as error:
-            print(f"Error getting transaction count: {error}")
+            logger.exception("Error getting transaction count")
             return 0
     
     def get_total_sales(self) -> Decimal:
@@ -220,7 +244,7 @@ class SalesDAO:
             result = self.session.query(func.sum(Transaction.total_amount)).scalar()
             return result if result else Decimal('0')
         except Exception as error:
-            print(f"Error getting total sales: {error}")
+            logger.exception("Error getting total sales")
             return Decimal('0')
     
     def get_sales_by_date_range(self, start_date: date, end_date: date) -> Decimal:
@@ -234,7 +258,7 @@ class SalesDAO:
             ).scalar()
             return result if result else Decimal('0')
         except Exception as error:
-            print(f"Error getting sales by date range: {error}")
+            logger.exception("Error getting sales by date range")
             return Decimal('0')
     
     def get_top_customers(self, limit: int = 10) -> List[Dict[str, Any]]:
@@ -260,7 +284,7 @@ class SalesDAO:
                 for result in results
             ]
         except Exception as error:
-            print(f"Error getting top customers: {error}")
+            logger.exception("Error getting top customers")
             return []
 
 def main():
@@ -1,7 +1,261 @@
 import psycopg2
 from psycopg2 import Error
+from psycopg2.extensions import make_dsn, parse_dsn
+from psycopg2.extras import execute_values
+from decimal import Decimal
+from typing import Iterator, Optional
+import asyncio
+import csv
+import io
+import json
 import os
-import pandas as pd
+import struct
+from db_constants import SALES_DATA_TABLE_NAME
+
+SALES_DATA_COLUMNS = """
+    first_name, last_name, customer_id, purchase_id,
+    item_purchased, item_id, item_description,
+    purchase_price, returned
+"""
+SALES_DATA_COLUMN_NAMES = [name.strip() for name in SALES_DATA_COLUMNS.split(",")]
+
+# Explicit dtypes so pandas skips type inference and never falls back to object columns
+SALES_DATA_DTYPES = {
+    "customer_id": "int32",
+    "purchase_id": "int32",
+    "item_id": "int32",
+    "purchase_price": "float64",
+    "returned": "int8",
+}
+
+def read_sales_data(path: str = 'sales_data.csv'):
+    """Parse the CSV with the multithreaded Arrow reader; text columns stay Arrow-backed strings"""
+    # Only the INSERT fallback needs a DataFrame, so pandas is not imported for the default COPY load
+    import pandas as pd
+    return pd.read_csv(path, engine="pyarrow", dtype_backend="pyarrow", dtype=SALES_DATA_DTYPES)
+
+def copy_sales_data(cursor, path: str):
+    """
+    Stream the CSV file straight into a single COPY: the file already matches the table,
+    so there is no parse into Python objects and re-serialization on the way.
+    utf-8-sig drops the byte order mark; HEADER skips the column names; empty fields load as NULL.
+    """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        cursor.copy_expert(
+            f"COPY {SALES_DATA_TABLE_NAME} ({SALES_DATA_COLUMNS}) FROM STDIN WITH (FORMAT CSV, HEADER true, NULL '')", f
+        )
+
+# Built once at import. execute_values mogrifies each row with the template and joins a
+# whole page into a single INSERT statement
+INSERT_SALES_DATA_SQL = f"INSERT INTO {SALES_DATA_TABLE_NAME} ({SALES_DATA_COLUMNS}) VALUES %s"
+INSERT_SALES_DATA_ROW = "(" + ",".join(["%s"] * len(SALES_DATA_COLUMN_NAMES)) + ")"
+
+def insert_sales_data(cursor, path: str):
+    """
+    Fallback for when COPY can't be used: batched multi-row INSERTs.
+    itertuples yields plain tuples (columns in CSV order) without building a Series per row.
+    Gains flatten out around 1k-10k rows per statement, so each page sends 10k.
+    """
+    df = read_sales_data(path)[SALES_DATA_COLUMN_NAMES]
+    # psycopg2 only adapts plain Python values: convert the numpy/Arrow scalars (and pd.NA -> None)
+    # for the whole frame once here instead of inside the row loop
+    df = df.astype(object).where(df.notna(), None)
+    rows = df.itertuples(index=False, name=None)
+    execute_values(cursor, INSERT_SALES_DATA_SQL, rows, template=INSERT_SALES_DATA_ROW, page_size=10000)
+
+# Binary COPY framing: signature, flags and header-extension length, then an end-of-data marker
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+PGCOPY_TRAILER = struct.pack("!h", -1)
+PGCOPY_NULL = struct.pack("!i", -1)
+
+def _encode_text(value: str) -> bytes:
+    return value.encode("utf-8")
+
+def _encode_int4(value: str) -> bytes:
+    return struct.pack("!i", int(value))
+
+def _encode_numeric(value: str) -> bytes:
+    """
+    NUMERIC wire format: ndigits, weight, sign, dscale (int16 each) followed by
+    base-10000 digits, most significant first; weight is the exponent of the first digit.
+    """
+    number = Decimal(value)
+    sign, _, exponent = number.as_tuple()
+    int_part, _, frac_part = format(abs(number), "f").partition(".")
+    int_part = int_part.lstrip("0")
+    int_part = int_part.zfill(-(-len(int_part) // 4) * 4)
+    frac_part = frac_part.ljust(-(-len(frac_part) // 4) * 4, "0")
+    digits = [int(int_part[i:i + 4]) for i in range(0, len(int_part), 4)]
+    digits += [int(frac_part[i:i + 4]) for i in range(0, len(frac_part), 4)]
+    weight = len(int_part) // 4 - 1
+    while digits and digits[0] == 0:
+        digits.pop(0)
+        weight -= 1
+    while digits and digits[-1] == 0:
+        digits.pop()
+    if not digits:
+        weight = 0
+    return struct.pack(f"!hhhh{len(digits)}H", len(digits), weight, 0x4000 if sign else 0,
+                       max(0, -exponent), *digits)
+
+# Binary encoder for each column of sales_data, in SALES_DATA_COLUMN_NAMES order
+SALES_DATA_ENCODERS = [
+    _encode_text, _encode_text, _encode_int4, _encode_int4,
+    _encode_text, _encode_int4, _encode_text,
+    _encode_numeric, _encode_int4,
+]
+
+def copy_sales_data_binary(cursor, path: str):
+    """
+    COPY in the binary format: fields are sent already encoded in the column's wire
+    format, so the server skips CSV lexing and text-to-type parsing for every value.
+    Empty CSV fields are sent as NULL, matching the CSV loader.
+    """
+    row_header = struct.pack("!h", len(SALES_DATA_ENCODERS))
+    buffer = io.BytesIO()
+    buffer.write(PGCOPY_HEADER)
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        next(reader)  # column names
+        for row in reader:
+            buffer.write(row_header)
+            for encode, value in zip(SALES_DATA_ENCODERS, row):
+                if value == '':
+                    buffer.write(PGCOPY_NULL)
+                else:
+                    field = encode(value)
+                    buffer.write(struct.pack("!i", len(field)))
+                    buffer.write(field)
+    buffer.write(PGCOPY_TRAILER)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {SALES_DATA_TABLE_NAME} ({SALES_DATA_COLUMNS}) FROM STDIN WITH (FORMAT BINARY)", buffer)
+
+# Python type of each sales_data column, in SALES_DATA_COLUMN_NAMES order
+SALES_DATA_CONVERTERS = [str, str, int, int, str, int, str, Decimal, int]
+
+def read_sales_records(path: str) -> Iterator[tuple]:
+    """Yield the CSV rows as typed tuples; empty fields become None"""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        next(reader)  # column names
+        for row in reader:
+            yield tuple(None if value == '' else convert(value)
+                        for convert, value in zip(SALES_DATA_CONVERTERS, row))
+
+def asyncpg_connect_kwargs(config: dict, dbname: str) -> dict:
+    """Translate a psycopg2 connection config (keywords or a dsn) into asyncpg.connect() arguments"""
+    params = parse_dsn(make_dsn(**{**config, "dbname": dbname}))
+    return {
+        "host": params.get("host"),
+        "port": int(params["port"]) if params.get("port") else None,
+        "user": params.get("user"),
+        "password": params.get("password") or None,
+        "database": params.get("dbname"),
+    }
+
+async def copy_sales_data_parallel(connect_kwargs: dict, path: str, workers: Optional[int] = None):
+    """
+    Split the rows into one chunk per worker and COPY the chunks concurrently, each over its
+    own pooled asyncpg connection (asyncpg encodes the records to binary COPY format in C).
+    Only worth it for files that outgrow a single COPY stream, and the table must already
+    be committed since every worker uses a separate connection.
+    """
+    import asyncpg
+    
+    records = list(read_sales_records(path))
+    if not records:
+        return
+    workers = max(1, min(workers or os.cpu_count() or 1, len(records)))
+    chunk_size = -(-len(records) // workers)
+    chunks = [records[i:i + chunk_size] for i in range(0, len(records), chunk_size)]
+    
+    async with asyncpg.create_pool(**connect_kwargs, min_size=len(chunks), max_size=len(chunks),
+                                   server_settings={"synchronous_commit": "off"}) as pool:
+        async def load(chunk):
+            async with pool.acquire() as connection:
+                await connection.copy_records_to_table(SALES_DATA_TABLE_NAME, records=chunk, columns=SALES_DATA_COLUMN_NAMES)
+        await asyncio.gather(*(load(chunk) for chunk in chunks))
+
+# How setup_database() loads the CSV file ("parallel" is handled separately, see copy_sales_data_parallel)
+LOADERS = {
+    "copy": copy_sales_data,
+    "binary": copy_sales_data_binary,
+    "insert": insert_sales_data,
+}
+
+# Schema permissions for jshutler, sent to the server as a single script
+SCHEMA_GRANTS = """
+    GRANT ALL ON SCHEMA public TO jshutler;
+    GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA public TO jshutler;
+    GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA public TO jshutler;
+    ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT ALL ON TABLES TO jshutler;
+    ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT ALL ON SEQUENCES TO jshutler;
+"""
+
+# Working superuser connection settings are remembered here so later runs skip the probing
+PG_CONFIG_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "evals-react-agent", "pgconfig.json")
+
+# Seconds libpq waits for each connection attempt, so a dead host fails fast
+CONNECT_TIMEOUT = 2
+
+def can_connect(config: dict) -> bool:
+    try:
+        psycopg2.connect(**config, connect_timeout=CONNECT_TIMEOUT).close()
+        return True
+    except Exception as e:
+        print(f"✗ Connection failed: {e}")
+        return False
+
+def env_connection_config():
+    """Connection settings from PG_DSN, or from PG_USER/PG_PASSWORD (None if neither is set)"""
+    if os.getenv("PG_DSN"):
+        return {"dsn": os.environ["PG_DSN"]}
+    if os.getenv("PG_USER"):
+        return {
+            "dbname": os.getenv("PG_DBNAME", "postgres"),
+            "user": os.environ["PG_USER"],
+            "password": os.getenv("PG_PASSWORD", ""),
+            "host": os.getenv("PG_HOST", "localhost"),
+            "port": os.getenv("PG_PORT", "5432")
+        }
+    return None
+
+def load_cached_connection_config():
+    try:
+        with open(PG_CONFIG_CACHE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_connection_config(config: dict):
+    """Write the config (it includes the password) readable only by the current user"""
+    try:
+        os.makedirs(os.path.dirname(PG_CONFIG_CACHE), exist_ok=True)
+        fd = os.open(PG_CONFIG_CACHE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(config, f)
+    except OSError as e:
+        print(f"Could not cache connection config: {e}")
+
+def find_connection_config():
+    """
+    Resolve the superuser connection settings: environment first, then the config cached
+    by a previous run, and only then probe the common local setups.
+    """
+    config = env_connection_config()
+    if config:
+        print("Using connection settings from the environment")
+        return config
+    
+    config = load_cached_connection_config()
+    if config and can_connect(config):
+        print(f"Using cached connection settings from {PG_CONFIG_CACHE}")
+        return config
+    
+    config = test_connection_parameters()
+    if config:
+        save_connection_config(config)
+    return config
 
 def test_connection_parameters():
     """Test different common PostgreSQL connection scenarios"""
@@ -41,7 +295,7 @@ def test_connection_parameters():
     for i, config in enumerate(connection_configs):
         try:
             print(f"Trying connection config {i+1}: user='{config['user']}', dbname='{config['dbname']}', password={'***' if config['password'] else 'None'}")
-            conn = psycopg2.connect(**config)
+            conn = psycopg2.connect(**config, connect_timeout=CONNECT_TIMEOUT)
             conn.close()
             print(f"✓ Connection successful with config {i+1}")
             return config
@@ -50,12 +304,12 @@ def test_connection_parameters():
     
     return None
 
-def setup_database():
+def setup_database(load_method: str = "copy"):
     conn = None
     try:
-        # First, test which connection parameters work
-        print("Testing PostgreSQL connection parameters...")
-        working_config = test_connection_parameters()
+        # First, find connection parameters that work
+        print("Resolving PostgreSQL connection parameters...")
+        working_config = find_connection_config()
         
         if not working_config:
             print("\n❌ Could not establish any connection to PostgreSQL.")
@@ -74,24 +328,19 @@ def setup_database():
         conn.autocommit = True
         cursor = conn.cursor()
 
-        # Create user if it doesn't exist
-        cursor.execute("SELECT 1 FROM pg_roles WHERE rolname='jshutler'")
-        if not cursor.fetchone():
-            cursor.execute("CREATE USER jshutler WITH PASSWORD 'password'")
-            print("Created user 'jshutler'")
-
-        # Drop database if it exists, then create it fresh
-        cursor.execute("SELECT 1 FROM pg_database WHERE datname='sales_db'")
-        if cursor.fetchone():
-            # Terminate existing connections to the database
-            cursor.execute("""
-                SELECT pg_terminate_backend(pid)
-                FROM pg_stat_activity
-                WHERE datname = 'sales_db' AND pid <> pg_backend_pid()
-            """)
-            cursor.execute("DROP DATABASE sales_db")
-            print("Dropped existing database 'sales_db'")
-        
+        # Create user if it doesn't exist (check and create in one statement)
+        cursor.execute("""
+            DO $$
+            BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'jshutler') THEN
+                    CREATE ROLE jshutler LOGIN PASSWORD 'password';
+                END IF;
+            END $$
+        """)
+
+        # Drop database if it exists, then create it fresh. FORCE (PostgreSQL 13+) terminates
+        # existing connections to it first
+        cursor.execute("DROP DATABASE IF EXISTS sales_db WITH (FORCE)")
         cursor.execute("CREATE DATABASE sales_db")
         cursor.execute("GRANT ALL PRIVILEGES ON DATABASE sales_db TO jshutler")
         print("Created database 'sales_db' and granted privileges")
@@ -99,43 +348,26 @@ def setup_database():
         # Close initial connection
         cursor.close()
         conn.close()
-        # Connect to the sales_db database as postgres to grant schema permissions
-        conn = psycopg2.connect(
-            dbname="sales_db",
-            user="postgres",
-            password="password",
-            host="localhost", 
-            port="5432"
-        )
-        conn.autocommit = True
+        # One connection to sales_db with the same superuser credentials does the rest:
+        # the schema grants, then the table and the load as jshutler via SET ROLE
+        conn = psycopg2.connect(**{**working_config, "dbname": "sales_db"})
         cursor = conn.cursor()
         
-        # Grant schema permissions to jshutler user
-        cursor.execute("GRANT ALL ON SCHEMA public TO jshutler")
-        cursor.execute("GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA public TO jshutler")
-        cursor.execute("GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA public TO jshutler")
-        cursor.execute("ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT ALL ON TABLES TO jshutler")
-        cursor.execute("ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT ALL ON SEQUENCES TO jshutler")
+        # Grant schema permissions to jshutler user: one round trip, one transaction
+        cursor.execute(SCHEMA_GRANTS)
+        conn.commit()
         print("Granted schema permissions to jshutler user")
         
-        # Close postgres connection
-        cursor.close()
-        conn.close()
-
-        # Connect to the sales_db database as jshutler
-        conn = psycopg2.connect(
-            dbname="sales_db",
-            user="jshutler",
-            password="password",
-            host="localhost", 
-            port="5432"
-        )
-        conn.autocommit = True
-        cursor = conn.cursor()
+        # Create the table as jshutler so it owns it. Table creation and the load
+        # run in one transaction, committed once at the end
+        cursor.execute("SET ROLE jshutler")
+        # Nothing is lost if the machine dies mid-import (we just rerun it), so don't wait on fsync
+        cursor.execute("SET LOCAL synchronous_commit = off")
         
-        # Create single table matching CSV structure
-        cursor.execute("""
-            CREATE TABLE sales_data (
+        # Create single table matching CSV structure. UNLOGGED skips writing WAL for every loaded row;
+        # any indexes or constraints belong after the load so rows aren't indexed one at a time.
+        cursor.execute(f"""
+            CREATE UNLOGGED TABLE {SALES_DATA_TABLE_NAME} (
                 first_name VARCHAR(100),
                 last_name VARCHAR(100),
                 customer_id INTEGER,
@@ -151,22 +383,16 @@ def setup_database():
         print("Table created successfully!")
         
         # Load data from CSV
-        df = pd.read_csv('sales_data.csv')
-        
-        # Insert data
-        for _, row in df.iterrows():
-            cursor.execute("""
-                INSERT INTO sales_data (
-                    first_name, last_name, customer_id, purchase_id,
-                    item_purchased, item_id, item_description,
-                    purchase_price, returned
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                row['first_name'], row['last_name'], row['customer_id'],
-                row['purchase_id'], row['item_purchased'], row['item_id'],
-                row['item_description'], row['purchase_price'], row['returned']
-            ))
+        if load_method == "parallel":
+            # The workers' connections only see the table once it is committed
+            conn.commit()
+            asyncio.run(copy_sales_data_parallel(asyncpg_connect_kwargs(working_config, "sales_db"), 'sales_data.csv'))
+        else:
+            LOADERS[load_method](cursor, 'sales_data.csv')
+        # Make the table crash safe again now that the bulk load is done
+        cursor.execute(f"ALTER TABLE {SALES_DATA_TABLE_NAME} SET LOGGED")
+        conn.commit()
+        cursor.execute("RESET ROLE")
         
         print("Data imported successfully!")
         return True
@@ -0,0 +1,76 @@
+# Splits compound questions into independent sub-questions that the agent can answer concurrently
+
+from typing import List
+import logging
+import re
+from langchain_core.language_models import BaseChatModel
+from pydantic import BaseModel, Field
+
+
+logger = logging.getLogger(__name__)
+
+
+DECOMPOSE_PROMPT = """Split the user's question into the smallest set of independent sub-questions
+that can each be answered on their own by querying the database. Each sub-question must be self-contained.
+If the question only asks for one thing, return it unchanged as the only sub-question.
+
+Question: {query}"""
+
+SYNTHESIZE_PROMPT = """Answer the user's question using the answers to its sub-questions below.
+Do not add information that is not in the answers.
+
+Question: {query}
+
+{answers}"""
+
+# " and ", several question marks, or list markers at the start of a line
+_COMPOUND_RE = re.compile(r"\band\b|\?.*\?|^\s*(?:[-*•]|\d+[.)])\s", re.I | re.S | re.M)
+
+
+class SubQuestions(BaseModel):
+    """Independent sub-questions that together answer the user's question"""
+    sub_questions: List[str] = Field(..., description="Self-contained sub-questions, in the order they were asked")
+
+
+def looks_compound(query: str) -> bool:
+    """Cheap check so simple questions skip the planner call"""
+    return bool(_COMPOUND_RE.search(query))
+
+
+class QueryDecomposer:
+    """
+    Least-to-most style planner: one structured LLM call breaks a question into atomic
+    sub-questions, and one more call merges the sub-answers into the final answer.
+    """
+
+    def __init__(self, model: BaseChatModel, max_sub_questions: int = 4):
+        self.model = model
+        # Tool calling works through every provider, including the Inspect bridge, which does
+        # not pass a JSON response_format on to Anthropic models
+        self.planner = model.with_structured_output(SubQuestions, method="function_calling")
+        self.max_sub_questions = max_sub_questions
+
+    async def decompose(self, query: str) -> List[str]:
+        """Return the sub-questions for a query, or just the query itself if it is atomic"""
+        if not looks_compound(query):
+            return [query]
+        try:
+            plan: SubQuestions = await self.planner.ainvoke(DECOMPOSE_PROMPT.format(query=query))
+            sub_questions = [q.strip() for q in plan.sub_questions if q.strip()]
+        except Exception:
+            # Planning is only an optimization, a bad plan must not fail the question
+            logger.warning("Could not decompose question, answering it as a whole", exc_info=True)
+            return [query]
+        if not sub_questions or len(sub_questions) > self.max_sub_questions:
+            # Too many parts to fan out: one agent loop answers all of them instead of dropping some
+            return [query]
+        return sub_questions
+
+    async def synthesize(self, query: str, sub_questions: List[str], answers: List[str]) -> str:
+        """Merge the sub-answers into a single answer to the original question"""
+        answer_block = "\n\n".join(
+            f"Sub-question {i}: {question}\nAnswer: {answer}"
+            for i, (question, answer) in enumerate(zip(sub_questions, answers), start=1)
+        )
+        response = await self.model.ainvoke(SYNTHESIZE_PROMPT.format(query=query, answers=answer_block))
+        return str(response.content)
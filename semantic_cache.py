@@ -0,0 +1,277 @@
+# Caches that let repeated questions and repeated SQL skip the LLM / database round trip
+
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Callable, Dict, Hashable, List, Optional
+import json
+import re
+import threading
+import time
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse whitespace/trailing punctuation so trivial rewordings share a key"""
+    return " ".join(text.lower().split()).rstrip(" ?.!")
+
+
+_SQL_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_SQL_QUOTED_RE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_SQL_READ_RE = re.compile(r"^\s*(select|with|show|explain)\b", re.I)
+# Anywhere in a statement these mean it can change data: data-modifying CTEs, SELECT ... INTO,
+# EXPLAIN ANALYZE <write>, DDL, sequence functions
+_SQL_WRITE_RE = re.compile(
+    r"\b(insert|update|delete|merge|into|analyze|truncate|create|drop|alter|copy|call|nextval|setval)\b", re.I
+)
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Normalize a SQL string for use as a cache key: strip comments, collapse whitespace,
+    drop the trailing semicolon and lowercase everything outside quoted literals/identifiers
+    (Postgres folds unquoted identifiers to lowercase anyway).
+    """
+    query = _SQL_COMMENT_RE.sub(" ", query)
+    # split() with a capture group alternates unquoted / quoted chunks; quoted ones are kept verbatim
+    parts = _SQL_QUOTED_RE.split(query)
+    normalized = "".join(part if i % 2 else re.sub(r"\s+", " ", part.lower()) for i, part in enumerate(parts))
+    return normalized.strip().rstrip(";").rstrip()
+
+
+def is_read_only_sql(query: str) -> bool:
+    """
+    True for statements that only read data and are therefore safe to cache.
+    Errs on the side of False: a read that mentions a write keyword is just not cached.
+    """
+    query = _SQL_QUOTED_RE.sub(" ", _SQL_COMMENT_RE.sub(" ", query))
+    return bool(_SQL_READ_RE.match(query)) and not _SQL_WRITE_RE.search(query)
+
+
+_SQL_TOKEN_RE = re.compile(r"""
+    (?P<skip>--[^\n]*|/\*.*?\*/                 # comments
+      |\$(?P<tag>\w*)\$.*?\$(?P=tag)\$          # dollar-quoted strings
+      |[eEbBxXuU]&?'(?:[^']|'')*'                  # escape / bit / unicode strings
+      |"(?:[^"]|"")*"                              # quoted identifiers
+      |::\w+|:\w+|%\(\w+\)s)                    # casts and existing bind params
+    |(?P<string>'(?:[^']|'')*')
+    |(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    |(?P<word>[A-Za-z_][\w$]*)
+    |(?P<json>->>|->|\#>>|\#>|@>|<@)         # JSON / containment operators, not comparisons
+    |(?P<op><=|>=|<>|!=|[=<>])
+""", re.S | re.X)
+# Tokens after which a literal is a compared value and gets lifted. "between and" stands for
+# the AND that closes a BETWEEN, so only the range bounds qualify, not other AND operands
+_LIFT_AFTER = {"=", "<>", "!=", "<", ">", "<=", ">=", "between", "between and"}
+
+
+def parameterize_sql(query: str, prefix: str = "_lit") -> tuple[str, Dict[str, Any]]:
+    """
+    Replace literal values in a SQL string with named bind parameters so queries that only
+    differ in their constants share one statement. Conservative on purpose: only quoted strings
+    and numbers that are compared with =, <>, <, >, <=, >= or are BETWEEN bounds are lifted;
+    everything else (SELECT-list values, function arguments, LIKE patterns, LIMIT, IN lists,
+    typed literals such as DATE '...', values followed by a :: cast) stays inline.
+    Returns the rewritten query (using :name placeholders) and the extracted values.
+    """
+    params: Dict[str, Any] = {}
+    pieces: List[str] = []
+    position = 0
+    previous = ""  # last significant token, lowercased
+    in_between = False
+
+    for match in _SQL_TOKEN_RE.finditer(query):
+        kind = match.lastgroup if match.lastgroup != "tag" else "skip"
+        token = match.group(0)
+        value: Any = None
+
+        if kind in ("string", "number") and previous in _LIFT_AFTER \
+                and not query[match.end():].lstrip().startswith("::"):
+            if kind == "string":
+                value = token[1:-1].replace("''", "'")
+            else:
+                value = Decimal(token) if any(c in token for c in ".eE") else int(token)
+
+        if kind == "word":
+            word = token.lower()
+            if word == "between":
+                in_between = True
+            elif word == "and" and in_between:
+                # Closes the BETWEEN whatever its bounds are, later ANDs are plain boolean ANDs
+                in_between = False
+                word = "between and"
+            previous = word
+        elif kind in ("op", "json", "string", "number"):
+            previous = token.lower()
+
+        if value is None:
+            continue
+        name = f"{prefix}{len(params)}"
+        params[name] = value
+        pieces.append(query[position:match.start()])
+        pieces.append(f":{name}")
+        position = match.end()
+
+    pieces.append(query[position:])
+    return "".join(pieces), params
+
+
+def _default_embedder() -> Optional[Callable[[List[str]], np.ndarray]]:
+    """
+    Load a small local ONNX sentence-embedding model via FastEmbed.
+    FastEmbed is optional: without it the semantic tier is disabled and only exact matches hit.
+    """
+    try:
+        from fastembed import TextEmbedding
+    except ImportError:
+        return None
+    model = TextEmbedding("BAAI/bge-small-en-v1.5")
+    return lambda texts: np.array(list(model.embed(texts)), dtype=np.float32)
+
+
+class SemanticCache:
+    """
+    Two tier cache for agent answers keyed by the user query.
+    Tier 0 is an exact-match LRU on the normalized query text, tier 1 finds the most
+    similar previous query by cosine similarity of sentence embeddings.
+    Answers expire after `ttl` seconds, since they describe the database at the time they were made.
+    `scope` partitions the cache (e.g. by agent config): lookups only match entries stored with the same scope.
+    """
+
+    def __init__(self,
+                 threshold: float = 0.95,
+                 max_entries: int = 1024,
+                 embed: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 ttl: float = 60.0):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._embed = embed
+        self._embedder_loaded = embed is not None
+        self._entries: "OrderedDict[tuple[Hashable, str], tuple[Optional[np.ndarray], Any, float]]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[tuple[Hashable, str]] = []
+        self._lock = threading.Lock()
+
+    def _embedding(self, text: str) -> Optional[np.ndarray]:
+        if not self._embedder_loaded:
+            self._embed = _default_embedder()
+            self._embedder_loaded = True
+        if self._embed is None:
+            return None
+        vector = np.asarray(self._embed([text])[0], dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _evict_expired(self):
+        """Drop answers older than the TTL (caller holds the lock)"""
+        now = time.monotonic()
+        expired = [key for key, (_, _, stored_at) in self._entries.items() if now - stored_at > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _index(self) -> Optional[np.ndarray]:
+        """Stack the stored embeddings into one matrix, rebuilt only after the cache changes"""
+        if self._matrix is None:
+            self._matrix_keys = [key for key, (vector, _, _) in self._entries.items() if vector is not None]
+            if self._matrix_keys:
+                self._matrix = np.vstack([self._entries[key][0] for key in self._matrix_keys])
+        return self._matrix
+
+    def get(self, query: str, scope: Hashable = None) -> Optional[Any]:
+        """Return the cached value for this query or a near-duplicate of it in the same scope, if any"""
+        text = normalize_text(query)
+        key = (scope, text)
+        with self._lock:
+            self._evict_expired()
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][1]
+            if not self._entries:
+                return None
+
+        vector = self._embedding(text)
+        if vector is None:
+            return None
+
+        with self._lock:
+            # Entries may have expired while the query was being embedded
+            self._evict_expired()
+            matrix = self._index()
+            if matrix is None:
+                return None
+            similarities = matrix @ vector
+            in_scope = np.fromiter((entry_scope == scope for entry_scope, _ in self._matrix_keys),
+                                   dtype=bool, count=len(self._matrix_keys))
+            similarities[~in_scope] = -np.inf
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            best_key = self._matrix_keys[best]
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key][1]
+
+    def put(self, query: str, value: Any, scope: Hashable = None):
+        """Store the value for this query, evicting the least recently used entry when full"""
+        text = normalize_text(query)
+        key = (scope, text)
+        vector = self._embedding(text)
+        with self._lock:
+            self._entries[key] = (vector, value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after `ttl` seconds.
+    `generation` increments on every clear(): read it before computing a value and pass it
+    to put(), so a value computed before a concurrent clear() is not stored.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                # The cache was cleared while the value was computed, it may already be stale
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+
+class SQLResultCache(TTLCache):
+    """
+    Cache of query results keyed by normalized SQL and its parameters.
+    Entries expire so results never drift far from the database.
+    """
+
+    @staticmethod
+    def make_key(query: str, params: Optional[Dict[str, Any]] = None) -> Hashable:
+        return normalize_sql(query), json.dumps(params or {}, sort_keys=True, default=str)
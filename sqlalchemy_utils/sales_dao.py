@@ -1,10 +1,18 @@
 from sqlalchemy import create_engine, text, inspect
+from sqlalchemy.engine import Engine, Inspector, RowMapping
+from sqlalchemy.sql.elements import TextClause
 from sqlalchemy.orm import sessionmaker, Session
-from typing import List, Dict, Any, Optional
+from sqlalchemy.pool import QueuePool
+from typing import Iterator, List, Dict, Any, Optional
+from functools import lru_cache
+from contextlib import contextmanager
+from contextvars import ContextVar
 import os
-from db_constants import SALES_DB_CONNECTION_STRING
+from db_constants import SALES_DB_CONNECTION_STRING, TRANSACTIONS_TABLE_NAME, SALES_DATA_TABLE_NAME
 from pydantic import BaseModel, Field
 import logging
+import re
+import time
 from datetime import datetime
 import uuid
 
@@ -26,15 +34,96 @@ file_handler.setFormatter(formatter)
 logger.addHandler(file_handler)
 
 
+@lru_cache(maxsize=None)
+def _get_shared_engine(connection_string: str, pool_size: int = 10, max_overflow: int = 5,
+                       pool_pre_ping: bool = False, pool_recycle: int = 60, pool_timeout: int = 30) -> Engine:
+    """
+    Create the pooled engine for a connection string (and pool settings) once per process.
+    Every SalesDAO for the same database borrows connections from this pool
+    instead of paying a fresh connect/auth handshake.
+    """
+    return create_engine(
+        connection_string,
+        echo=False,  # Set to True for SQL query logging
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_pre_ping=pool_pre_ping,
+        pool_recycle=pool_recycle,
+        pool_timeout=pool_timeout
+    )
+
+
+_SQL_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_SELECT_RE = re.compile(r"^\s*(select|with)\b", re.I)
+_WRITE_RE = re.compile(r"\b(insert|update|delete|merge|into)\b", re.I)
+
+
+def _can_stream(sql_query: str) -> bool:
+    """
+    True for statements Postgres accepts in DECLARE CURSOR: SELECT and WITH ... SELECT without
+    data-modifying parts. Anything that merely looks like a write is run the normal way.
+    """
+    query = _SQL_COMMENT_RE.sub(" ", sql_query)
+    return bool(_SELECT_RE.match(query)) and not _WRITE_RE.search(query)
+
+
+# Bind parameter carrying the row cap of a wrapped query
+_ROW_CAP_PARAM = "_row_cap"
+
+
+def _capped_query(sql_query: str) -> Optional[str]:
+    """
+    Wrap a plain SELECT / WITH ... SELECT in an outer LIMIT so the server stops at the row cap
+    within a single autocommit round trip. None when wrapping isn't known to be valid
+    (writes, SHOW/EXPLAIN, or a semicolon inside the statement).
+    """
+    if not _can_stream(sql_query):
+        return None
+    body = sql_query.strip().rstrip(";").rstrip()
+    if ";" in body:
+        return None
+    # Newlines keep a trailing -- comment from swallowing the closing parenthesis
+    return f"SELECT * FROM (\n{body}\n) AS _capped LIMIT :{_ROW_CAP_PARAM}"
+
+
+class QueryResult(list):
+    """Rows returned by SalesDAO.run_sql; `truncated` is True when the row limit cut the result short"""
+    truncated: bool = False
+
+
+@lru_cache(maxsize=256)
+def _text(sql_query: str) -> TextClause:
+    """
+    Build each distinct statement's TextClause once. Its cache key then hits the engine's
+    compiled cache, so repeated queries skip both bind-param parsing and compilation.
+    """
+    return text(sql_query)
+
+
 class SalesDAO:
     """
     Data Access Object for sales database operations using SQLAlchemy
+    
+    The pool defaults suit running behind PgBouncer: no pre-ping round trip on checkout
+    and connections recycled after a minute. Without a pooler in front, pass
+    pool_pre_ping=True (and a longer pool_recycle) to detect dropped connections.
     """
     
-    def __init__(self, connection_string: str):
-        self.session: Optional[Session] = None
-        self.engine = None
+    def __init__(self, connection_string: str = SALES_DB_CONNECTION_STRING, *,
+                 pool_size: int = 10, max_overflow: int = 5, pool_pre_ping: bool = False,
+                 pool_recycle: int = 60, pool_timeout: int = 30, schema_ttl: float = 3600):
+        self.engine: Optional[Engine] = None
+        self.SessionLocal: Optional[sessionmaker] = None
+        self._inspector: Optional[Inspector] = None
+        self._inspected_at = 0.0
+        # Reflected schema is re-read at least this often (seconds), to pick up DDL run elsewhere
+        self.schema_ttl = schema_ttl
+        # Session of the transaction() block active in the current thread/task, if any
+        self._batch_session: ContextVar[Optional[Session]] = ContextVar(f"sales_dao_batch_{id(self)}", default=None)
         self.connection_string = connection_string
+        self.pool_options = dict(pool_size=pool_size, max_overflow=max_overflow, pool_pre_ping=pool_pre_ping,
+                                 pool_recycle=pool_recycle, pool_timeout=pool_timeout)
         self.connect(connection_string)
     
     def __enter__(self):
@@ -46,45 +135,56 @@ class SalesDAO:
         """Context manager exit"""
         self.disconnect()
     
-    def get_engine(self, connection_string: str):
+    def get_engine(self, connection_string: str) -> Engine:
         """
-        Create and return SQLAlchemy engine for sales database
+        Return the shared SQLAlchemy engine for sales database
         """
         try:
-            engine = create_engine(
-                connection_string,
-                echo=False,  # Set to True for SQL query logging
-                pool_size=5,
-                max_overflow=10
-            )
+            engine = _get_shared_engine(connection_string, **self.pool_options)
             
-            print("Successfully created SQLAlchemy engine for sales database!")
+            logger.debug("Using pooled SQLAlchemy engine for sales database", extra={'session_id': session_id})
             return engine
             
         except Exception as error:
-            print(f"Error creating SQLAlchemy engine: {error}")
+            logger.exception("Error creating SQLAlchemy engine", extra={'session_id': session_id})
             raise error
     
     def connect(self, connection_string: str) -> bool:
-        """Establish database connection"""
+        """Bind to the pooled engine. Connections are only opened when a query runs."""
         try:
             self.engine = self.get_engine(connection_string)
             if self.engine:
-                SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
-                self.session = SessionLocal()
-                print("Successfully connected to sales database!")
+                self._inspector = None
+                # One short-lived session per query keeps the DAO safe to share across threads.
+                # autoflush=False already suits this read-mostly workload: no flush before each query.
+                self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=self.engine)
+                logger.debug("Connected to sales database", extra={'session_id': session_id})
                 return True
             return False
         except Exception as error:
             raise error
     
     def disconnect(self):
-        """Close database connection"""
-        if self.session:
-            self.session.close()
-        if self.engine:
-            self.engine.dispose()
-        print("Database connection closed.")
+        """Release this DAO. The pooled engine is shared, so it is left open for other DAOs."""
+        self.SessionLocal = None
+        self._inspector = None
+        logger.debug("Database connection closed", extra={'session_id': session_id})
+    
+    @property
+    def inspector(self) -> Inspector:
+        """
+        Inspector for the engine, created on first use (creating one opens a connection).
+        It memoizes every reflection call, so repeated schema lookups skip the catalog queries;
+        the memo is dropped after schema_ttl seconds and whenever run_sql executes a write or DDL.
+        """
+        if self._inspector is None or time.monotonic() - self._inspected_at > self.schema_ttl:
+            self._inspector = inspect(self.engine)
+            self._inspected_at = time.monotonic()
+        return self._inspector
+    
+    def refresh_schema(self):
+        """Forget the reflected schema, e.g. after a migration"""
+        self._inspector = None
     
     def get_all_tables(self) -> List[str]:
         """
@@ -97,11 +197,10 @@ class SalesDAO:
             return []
         
         try:
-            inspector = inspect(self.engine)
-            table_names = inspector.get_table_names()
+            table_names = self.inspector.get_table_names()
             return table_names
         except Exception as error:
-            print(f"Error getting table names: {error}")
+            logger.exception("Error getting table names", extra={'session_id': session_id})
             raise error
     
     def get_schema_for_table(self, table_name: str) -> Dict[str, Any]:
@@ -117,10 +216,10 @@ class SalesDAO:
             return {}
         
         try:
-            inspector = inspect(self.engine)
+            inspector = self.inspector
             
-            # Get column information
-            columns = inspector.get_columns(table_name)
+            # Get column information as compact (name, type, nullable) tuples
+            columns = [(c['name'], str(c['type']), c['nullable']) for c in inspector.get_columns(table_name)]
             
             # Get primary keys
             primary_keys = inspector.get_pk_constraint(table_name)
@@ -143,20 +242,98 @@ class SalesDAO:
             return schema_info
             
         except Exception as error:
-            print(f"Error getting schema for table {table_name}: {error}")
+            logger.exception("Error getting schema for table %s", table_name, extra={'session_id': session_id})
             raise error
     
-    def run_sql(self, sql_query: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    def get_sales_metrics(self) -> Dict[str, Any]:
+        """
+        Compute the headline sales aggregates in a single scan of the sales_data table
+        Returns:
+            Dict[str, Any]: Totals for sales, purchases, customers and returns
+        """
+        logger.info(f"Computing sales metrics at {datetime.now().isoformat()}", extra={'session_id': session_id})
+        if not self.SessionLocal:
+            return {}
+        
+        try:
+            with self.SessionLocal() as session:
+                result = session.execute(text(f"""
+                    SELECT
+                        COALESCE(SUM(purchase_price), 0) AS total_sales,
+                        COALESCE(SUM(purchase_price) FILTER (WHERE returned = 0), 0) AS net_sales_excluding_returns,
+                        COUNT(*) AS items_sold,
+                        -- purchase_id is only unique per customer
+                        COUNT(DISTINCT (customer_id, purchase_id)) AS transaction_count,
+                        COUNT(DISTINCT customer_id) AS customer_count,
+                        COALESCE(SUM(returned), 0) AS items_returned
+                    FROM {SALES_DATA_TABLE_NAME}
+                """))
+                return dict(result.mappings().one())
+        except Exception as error:
+            logger.exception("Error computing sales metrics", extra={'session_id': session_id})
+            raise error
+    
+    @contextmanager
+    def transaction(self) -> Iterator[Session]:
+        """
+        Batch the writes of several run_sql calls into one transaction: statements inside
+        the block are not committed individually, the block commits once on exit (and rolls
+        back on error). Nested blocks join the outer transaction. The batch is tracked per
+        thread/task, so other users of a shared DAO are unaffected.
+        
+            with dao.transaction():
+                dao.run_sql("UPDATE ...")
+                dao.run_sql("INSERT ...")
+        """
+        batch_session = self._batch_session.get()
+        if batch_session is not None:
+            yield batch_session
+            return
+        
+        with self.SessionLocal() as session:
+            token = self._batch_session.set(session)
+            try:
+                yield session
+                session.commit()
+                # The batch may have changed the schema
+                self.refresh_schema()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                self._batch_session.reset(token)
+    
+    @staticmethod
+    def _fetch_rows(result, max_rows: int) -> QueryResult:
+        # RowMapping objects are dict-like and built in C, no per-row dict(zip(...))
+        # Fetch one row past the limit just to learn whether there are more
+        rows = QueryResult(result.mappings().fetchmany(max_rows + 1))
+        if len(rows) > max_rows:
+            del rows[max_rows:]
+            rows.truncated = True
+            logger.warning(f"Query result truncated to {max_rows} rows", extra={'session_id': session_id})
+        logger.info("Query executed successfully", extra={'session_id': session_id})
+        return rows
+    
+    @staticmethod
+    def _rows_affected(result) -> QueryResult:
+        logger.info(f"Query executed successfully. Rows affected: {result.rowcount}", extra={'session_id': session_id})
+        return QueryResult([{'rows_affected': result.rowcount}])
+    
+    def run_sql(self, sql_query: str, params: Optional[Dict[str, Any]] = None,
+                max_rows: int = 10_000) -> QueryResult:
         """
         Run arbitrary SQL query and return results
         Args:
             sql_query (str): SQL query to execute
             params (Dict[str, Any], optional): Query parameters
+            max_rows (int): Most rows a query returns. Plain SELECTs are capped on the server
+                with an outer LIMIT (or a server-side cursor), so rows past the cap never leave it
         Returns:
-            List[Dict[str, Any]]: Query results as list of dictionaries
+            QueryResult: Query results as list of dictionaries, `truncated` is set if rows were cut off
         """
-        if not self.session:
-            return []
+        if not self.SessionLocal:
+            return QueryResult()
         
         try:
             # Log query execution start
@@ -165,28 +342,69 @@ class SalesDAO:
             if params:
                 logger.info(f"Parameters: {params}", extra={'session_id': session_id})
             
-            # Execute the query
-            if params:
-                result = self.session.execute(text(sql_query), params)
-            else:
-                result = self.session.execute(text(sql_query))
+            # Inside transaction(): run on the batch session and leave the commit to the block
+            # Only fetch max_rows + 1 rows from the server (one more tells us the result was cut off).
+            # Plain reads get an outer LIMIT; the rest of the SELECTs fall back to a server-side cursor
+            statement, run_params, stream = sql_query, params or {}, _can_stream(sql_query)
+            capped = _capped_query(sql_query)
+            if capped is not None:
+                statement, run_params, stream = capped, {**run_params, _ROW_CAP_PARAM: max_rows + 1}, False
+            stream_options = {"stream_results": True, "max_row_buffer": max_rows + 1}
             
-            # For SELECT queries, fetch results
-            if sql_query.strip().upper().startswith('SELECT'):
-                # Convert result to list of dictionaries
-                columns = result.keys()
-                rows = [dict(zip(columns, row)) for row in result.fetchall()]
-                logger.info("Query executed successfully", extra={'session_id': session_id})
-                return rows
-            else:
-                # For INSERT, UPDATE, DELETE queries
-                self.session.commit()
-                logger.info(f"Query executed successfully. Rows affected: {result.rowcount}", extra={'session_id': session_id})
-                return [{'rows_affected': result.rowcount}]
+            batch_session = self._batch_session.get()
+            if batch_session is not None:
+                result = batch_session.execute(_text(statement), run_params,
+                                               execution_options=stream_options if stream else {})
+                return self._fetch_rows(result, max_rows) if result.returns_rows else self._rows_affected(result)
+            
+            # A server-side cursor has to live inside a transaction, so these reads can't use autocommit
+            if stream:
+                with self.engine.connect().execution_options(**stream_options) as connection:
+                    return self._fetch_rows(connection.execute(_text(statement), run_params), max_rows)
+            
+            # Otherwise run on an autocommit connection: reads skip the BEGIN/COMMIT round trips
+            # and each write commits by itself
+            with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                result = connection.execute(_text(statement), run_params)
+                # returns_rows comes from the driver, so WITH, SHOW, EXPLAIN and RETURNING are handled
+                if result.returns_rows:
+                    return self._fetch_rows(result, max_rows)
+                # For INSERT, UPDATE, DELETE queries. This is also the DDL path, so drop the reflected schema
+                self.refresh_schema()
+                return self._rows_affected(result)
                 
         except Exception as error:
             logger.error(f"Query execution failed: {str(error)}", extra={'session_id': session_id})
             raise error
+    
+    def stream_sql(self, sql_query: str, params: Optional[Dict[str, Any]] = None,
+                   batch_size: int = 10_000) -> Iterator[RowMapping]:
+        """
+        Run a SELECT through a server-side cursor and yield its rows as they arrive
+        Args:
+            sql_query (str): SELECT query to execute
+            params (Dict[str, Any], optional): Query parameters
+            batch_size (int): Rows fetched from the server per round trip
+        Returns:
+            Iterator[RowMapping]: Dict-like rows; only one batch is held in memory at a time
+        """
+        if not self.SessionLocal:
+            return
+        
+        logger.info(f"Streaming SQL query at {datetime.now().isoformat()}", extra={'session_id': session_id})
+        logger.info(f"Query: {sql_query}", extra={'session_id': session_id})
+        
+        try:
+            with self.SessionLocal() as session:
+                result = session.execute(
+                    _text(sql_query),
+                    params or {},
+                    execution_options={"stream_results": True, "yield_per": batch_size},
+                )
+                yield from result.mappings()
+        except Exception as error:
+            logger.error(f"Query execution failed: {str(error)}", extra={'session_id': session_id})
+            raise error
 
 
     
@@ -211,8 +429,8 @@ def main():
             print(f"Table: {schema.get('table_name')}")
             
             print("Columns:")
-            for column in schema.get('columns', []):
-                print(f"  - {column['name']}: {column['type']} (nullable: {column['nullable']})")
+            for name, column_type, nullable in schema.get('columns', []):
+                print(f"  - {name}: {column_type} (nullable: {nullable})")
             
             print(f"Primary Keys: {schema.get('primary_keys', {}).get('constrained_columns', [])}")
         
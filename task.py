@@ -1,15 +1,46 @@
+from typing import Iterator, Optional
+from pathlib import Path
+import os
+import ijson
 from inspect_ai import Task, task
-from inspect_ai.dataset import json_dataset
+from inspect_ai.dataset import MemoryDataset, Sample
 from inspect_ai.scorer import model_graded_fact
 from inspect_ai.solver import bridge
 from inspect_ai.model import get_model
 from inspect_react_agent import db_agent, REACT_AGENT_PROMPT
 
+def iter_json_samples(path: str, limit: Optional[int] = None) -> Iterator[Sample]:
+    """Parse a JSON array of records incrementally, yielding one Sample per record"""
+    with open(path, "rb") as f:
+        for i, record in enumerate(ijson.items(f, "item", use_float=True)):
+            if limit is not None and i >= limit:
+                return
+            if "input" not in record:
+                raise ValueError(f"No input in dataset record {record.get('id', i)}")
+            yield Sample(
+                input=record["input"],
+                target=record.get("target", ""),
+                id=record.get("id"),
+                metadata=record.get("metadata"),
+            )
+
+def streaming_json_dataset(path: str, limit: Optional[int] = None) -> MemoryDataset:
+    """
+    Drop-in for json_dataset() that never holds the raw JSON document in memory:
+    records are parsed one at a time and only the resulting Samples are kept.
+    With `limit`, reading stops after that many records.
+    """
+    return MemoryDataset(
+        samples=list(iter_json_samples(path, limit)),
+        name=Path(path).stem,
+        location=os.path.abspath(path),
+    )
+
 @task
 def db_testing():
     return Task(
-        dataset=json_dataset("db_testing.json"),
+        dataset=streaming_json_dataset("db_testing.json"),
         solver=[bridge(db_agent(react_agent_prompt=REACT_AGENT_PROMPT, use_anthropic=False))],
         scorer=model_graded_fact(model="anthropic/claude-3-haiku-20240307"),  # Use GPT-4 for scoring
         model="anthropic/claude-3-haiku-20240307"  # Use Claude Sonnet for the solver
-    )
\ No newline at end of file
+    )